@@ -8,9 +8,11 @@ import json
 import re
 from base64 import urlsafe_b64encode
 from datetime import date, datetime, timedelta
+from functools import lru_cache
 from typing import Any, Dict, Iterable, List, Mapping, Optional
 
 import httpx
+import orjson
 
 from src.config import settings
 
@@ -43,9 +45,10 @@ _RETRY_ATTEMPTS = 3
 _RETRY_BACKOFF = (0.2, 0.5, 1.0)
 
 
+@lru_cache(maxsize=2048)
 def make_bearer_for_user(user_id: int) -> str:
     """Return Authorization header value for a STAS user."""
-    payload = json.dumps({"uid": int(user_id)}, separators=(",", ":")).encode("utf-8")
+    payload = orjson.dumps({"uid": int(user_id)})
     token = urlsafe_b64encode(payload).decode("ascii").rstrip("=")
     return f"Bearer t_{token}"
 
@@ -314,8 +317,9 @@ async def _request_json(
             )
 
         try:
-            return response.json()
-        except ValueError as exc:  # pragma: no cover
+            # C-декодер по сырым байтам вместо stdlib json внутри httpx
+            return orjson.loads(response.content)
+        except orjson.JSONDecodeError as exc:  # pragma: no cover
             raise GwBadResponse("invalid JSON from gateway") from exc
 
     raise GwUnavailable("gateway request failed") from last_error
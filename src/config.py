@@ -5,6 +5,8 @@ import os
 @dataclass(frozen=True)
 class Settings:
     BRIDGE_BASE: str = os.getenv("BRIDGE_BASE", "https://intervals.stas.run/gw")
+    # Дублировать ли schema под легаси-ключом input_schema в манифесте
+    LEGACY_INPUT_SCHEMA: bool = os.getenv("MCP_LEGACY_INPUT_SCHEMA", "0") == "1"
     # Render injects PORT; uvicorn uses $PORT. No secrets here.
 
 
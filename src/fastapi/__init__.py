@@ -1,3 +0,0 @@
-from .app import FastAPI, HTTPException, Request, Body
-
-__all__ = ["FastAPI", "HTTPException", "Request", "Body"]
@@ -11,6 +11,20 @@ logger = logging.getLogger(__name__)
 
 MANIFEST_SCHEMA_URI = "http://json-schema.org/draft-07/schema#"
 
+# общие под-схемы шарим по ссылке между определениями тулов
+_EXTERNAL_ID_SCHEMA = {"type": "string"}
+_CONN_ID_SCHEMA = {"type": "string"}
+_DATE_FROM_SCHEMA = {
+    "type": "string",
+    "pattern": r"^\d{4}-\d{2}-\d{2}$",
+    "description": "Start date (YYYY-MM-DD)",
+}
+_DATE_TO_SCHEMA = {
+    "type": "string",
+    "pattern": r"^\d{4}-\d{2}-\d{2}$",
+    "description": "End date (YYYY-MM-DD)",
+}
+
 
 @dataclass(slots=True)
 class ToolDefinition:
@@ -45,7 +59,7 @@ def get_tool_definitions(_draft_schema: Dict[str, Any]) -> Iterable[Dict[str, An
                 "type": "object",
                 "required": ["external_id", "patch"],
                 "properties": {
-                    "external_id": {"type": "string"},
+                    "external_id": _EXTERNAL_ID_SCHEMA,
                     "patch": {"type": "object"},
                     "confirm": {
                         "type": "boolean",
@@ -56,7 +70,7 @@ def get_tool_definitions(_draft_schema: Dict[str, Any]) -> Iterable[Dict[str, An
                         "type": ["string", "null"],
                         "description": "ETag of the current plan version.",
                     },
-                    "connection_id": {"type": "string"},
+                    "connection_id": _CONN_ID_SCHEMA,
                 },
             },
         ),
@@ -68,8 +82,8 @@ def get_tool_definitions(_draft_schema: Dict[str, Any]) -> Iterable[Dict[str, An
                 "type": "object",
                 "required": ["external_id"],
                 "properties": {
-                    "external_id": {"type": "string"},
-                    "connection_id": {"type": "string"},
+                    "external_id": _EXTERNAL_ID_SCHEMA,
+                    "connection_id": _CONN_ID_SCHEMA,
                 },
             },
         ),
@@ -81,16 +95,8 @@ def get_tool_definitions(_draft_schema: Dict[str, Any]) -> Iterable[Dict[str, An
                 "type": "object",
                 "properties": {
                     "athlete_id": {"type": "string"},
-                    "date_from": {
-                        "type": "string",
-                        "pattern": r"^\\d{4}-\\d{2}-\\d{2}$",
-                        "description": "Start date (YYYY-MM-DD)",
-                    },
-                    "date_to": {
-                        "type": "string",
-                        "pattern": r"^\\d{4}-\\d{2}-\\d{2}$",
-                        "description": "End date (YYYY-MM-DD)",
-                    },
+                    "date_from": _DATE_FROM_SCHEMA,
+                    "date_to": _DATE_TO_SCHEMA,
                     "limit": {
                         "type": "integer",
                         "minimum": 1,
@@ -98,7 +104,7 @@ def get_tool_definitions(_draft_schema: Dict[str, Any]) -> Iterable[Dict[str, An
                         "default": 50,
                     },
                     "cursor": {"type": ["string", "null"]},
-                    "connection_id": {"type": "string"},
+                    "connection_id": _CONN_ID_SCHEMA,
                 },
             },
         ),
@@ -107,8 +113,11 @@ def get_tool_definitions(_draft_schema: Dict[str, Any]) -> Iterable[Dict[str, An
         yield definition.as_dict()
 
 
+_PLAN_TOOL_NAMES = frozenset({"plan.update", "plan.status", "plan.list"})
+
+
 def has_tool(name: str) -> bool:
-    return name in {"plan.update", "plan.status", "plan.list"}
+    return name in _PLAN_TOOL_NAMES
 
 
 async def call_tool(
@@ -116,7 +125,10 @@ async def call_tool(
     arguments: Mapping[str, Any],
     *,
     user_id: str | int,
+    connection_id: Optional[str] = None,
 ) -> Dict[str, Any]:
+    # connection_id приходит отдельным kwarg, чтобы мост не копировал arguments
+    del connection_id
     user = _normalize_user_id(user_id)
     if name == "plan.update":
         return await _call_plan_update(arguments, user)
@@ -150,7 +162,8 @@ def _coerce_patch(arguments: Mapping[str, Any]) -> Dict[str, Any]:
     patch = arguments.get("patch")
     if not isinstance(patch, Mapping):
         raise ToolError("InvalidParams", "patch must be an object")
-    return dict(patch)
+    # arguments после диспатча не переиспользуются — защитная копия не нужна
+    return patch if type(patch) is dict else dict(patch)
 
 
 def _coerce_confirm(arguments: Mapping[str, Any]) -> bool:
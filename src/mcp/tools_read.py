@@ -1,80 +1,208 @@
 # src/mcp/tools_read.py
+"""Read-only MCP tools backed by the STAS gateway."""
+
 from __future__ import annotations
-import os, json, base64
-from typing import Any, Dict, Tuple, Optional
-from datetime import datetime, timedelta
-import aiohttp
-
-__all__ = ["user_summary_fetch", "user_last_training_fetch"]
-
-def _window_14d() -> Tuple[str, str]:
-    newest = datetime.utcnow().date()
-    oldest = newest - timedelta(days=14)
-    return oldest.isoformat(), newest.isoformat()
-
-def _get(s: Dict[str, Any], key: str, default=None):
-    v = s.get(key)
-    return v if v not in (None, "") else default
-
-def _auth_bearer(user_id: Optional[int]) -> Optional[str]:
-    env_token = os.getenv("STAS_GW_TOKEN")
-    if env_token:
-        return env_token
-    if not user_id:
-        return None
+
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Mapping, Optional
+
+import orjson
+
+from src.clients import gw
+from src.session import store as session_store
+
+
+class ToolError(RuntimeError):
+    def __init__(self, code: str, message: str, data: Any | None = None) -> None:
+        super().__init__(message)
+        self.code = code
+        self.message = message
+        self.data = data
+
+
+@dataclass(slots=True)
+class _ReadToolDefinition:
+    name: str
+    description: str
+    input_schema: Dict[str, Any]
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.name,
+            "name": self.name,
+            "description": self.description,
+            "inputSchema": self.input_schema,
+        }
+
+
+# общие под-схемы шарим по ссылке — меньше дублей в куче и в tools/list
+_USER_ID_SCHEMA = {"type": "integer"}
+_CONN_ID_SCHEMA = {"type": "string"}
+_DATE_SCHEMA = {"type": "string", "description": "YYYY-MM-DD"}
+
+_READ_TOOLS = (
+    _ReadToolDefinition(
+        name="user.summary.fetch",
+        description="Fetch a plain-text summary for the linked or stored user.",
+        input_schema={
+            "$schema": "http://json-schema.org/draft-07/schema#",
+            "type": "object",
+            "properties": {
+                "user_id": _USER_ID_SCHEMA,
+                "connection_id": _CONN_ID_SCHEMA,
+            },
+        },
+    ),
+    _ReadToolDefinition(
+        name="user.last_training.fetch",
+        description="Return trainings for the last 14 days (or an explicit window).",
+        input_schema={
+            "$schema": "http://json-schema.org/draft-07/schema#",
+            "type": "object",
+            "properties": {
+                "user_id": _USER_ID_SCHEMA,
+                "oldest": _DATE_SCHEMA,
+                "newest": _DATE_SCHEMA,
+                "connection_id": _CONN_ID_SCHEMA,
+            },
+        },
+    ),
+)
+
+_TOOL_DEFINITIONS = {tool.name: tool for tool in _READ_TOOLS}
+
+
+def get_tool_definitions() -> List[Dict[str, Any]]:
+    return [tool.as_dict() for tool in _READ_TOOLS]
+
+
+def has_tool(name: str) -> bool:
+    return name in _TOOL_DEFINITIONS
+
+
+async def call_tool(name: str, arguments: Mapping[str, Any]) -> Any:
+    if name == "user.summary.fetch":
+        return await _call_user_summary(arguments)
+    if name == "user.last_training.fetch":
+        return await _call_last_training(arguments)
+    raise ToolError("InvalidParams", f"Unknown tool '{name}'")
+
+
+def _today() -> date:
+    return date.today()
+
+
+def _resolve_user_id(arguments: Mapping[str, Any]) -> int:
+    value = arguments.get("user_id")
+    if value is None:
+        value = session_store.get_user_id()
+    if value is None:
+        raise ToolError(
+            "InvalidParams",
+            "user_id is required; call session.set_user_id(user_id) first",
+        )
+    if isinstance(value, bool):
+        raise ToolError("InvalidParams", "user_id must be an integer")
     try:
-        payload = json.dumps({"uid": int(user_id)}).encode("utf-8")
-        b = base64.urlsafe_b64encode(payload).decode("utf-8").rstrip("=")
-        return f"t_{b}"
-    except Exception:
+        user = int(value)
+    except (TypeError, ValueError):
+        raise ToolError("InvalidParams", "user_id must be an integer") from None
+    if user < 0:
+        raise ToolError("InvalidParams", "user_id must be non-negative")
+    return user
+
+
+def _coerce_date(arguments: Mapping[str, Any], key: str) -> Optional[date]:
+    value = arguments.get(key)
+    if value is None:
         return None
+    if isinstance(value, str):
+        try:
+            return date.fromisoformat(value)
+        except ValueError:
+            raise ToolError(
+                "InvalidParams", f"{key} must be formatted as YYYY-MM-DD"
+            ) from None
+    raise ToolError("InvalidParams", f"{key} must be a string")
+
+
+async def _call_user_summary(arguments: Mapping[str, Any]) -> str:
+    user_id = _resolve_user_id(arguments)
+    try:
+        payload = await gw.get_user_summary(user_id)
+    except gw.GwUnavailable as exc:
+        raise ToolError("GwUnavailable", "gateway unavailable") from exc
+    except gw.GwBadResponse as exc:
+        data = {"status": exc.status_code} if exc.status_code is not None else None
+        raise ToolError("GwBadResponse", "gateway returned bad response", data) from exc
+    return _summary_text(payload)
+
+
+def _summary_text(payload: Any) -> str:
+    summary = payload.get("user_summary") if isinstance(payload, Mapping) else None
+    if not isinstance(summary, Mapping):
+        summary = payload if isinstance(payload, Mapping) else {}
+    for key in ("text", "summary", "description"):
+        value = summary.get(key)
+        if isinstance(value, str) and value.strip():
+            return value
+    # orjson даёт тот же компактный не-ASCII вывод, но без питоньего сериализатора
+    return orjson.dumps(summary).decode("utf-8")
 
-def _base_pub() -> str:
-    return os.getenv("STAS_GW_BASE", "https://intervals.stas.run/gw")
 
-async def _http_json(session: aiohttp.ClientSession, url: str, bearer: Optional[str]) -> Dict[str, Any]:
-    headers = {}
-    if bearer:
-        headers["Authorization"] = f"Bearer {bearer}"
-    async with session.get(url, headers=headers, timeout=30) as r:
-        txt = await r.text()
+async def _call_last_training(arguments: Mapping[str, Any]) -> Dict[str, Any]:
+    user_id = _resolve_user_id(arguments)
+    oldest = _coerce_date(arguments, "oldest")
+    newest = _coerce_date(arguments, "newest")
+    if newest is None:
+        newest = _today()
+    if oldest is None:
+        oldest = newest - timedelta(days=14)
+    if oldest > newest:
+        raise ToolError("InvalidParams", "oldest must not be after newest")
+
+    try:
+        items = await gw.get_trainings(user_id=user_id, oldest=oldest, newest=newest)
+    except gw.GwUnavailable as exc:
+        raise ToolError("GwUnavailable", "gateway unavailable") from exc
+    except gw.GwBadResponse as exc:
+        data = {"status": exc.status_code} if exc.status_code is not None else None
+        raise ToolError("GwBadResponse", "gateway returned bad response", data) from exc
+
+    return {"items": _filter_future_trainings(items, newest)}
+
+
+def _filter_future_trainings(
+    trainings: List[Dict[str, Any]], newest: date
+) -> List[Dict[str, Any]]:
+    result: List[Dict[str, Any]] = []
+    for training in trainings:
+        training_date = _extract_training_date(training)
+        if training_date is None or training_date <= newest:
+            result.append(training)
+    return result
+
+
+def _extract_training_date(training: Mapping[str, Any]) -> Optional[date]:
+    value = (
+        training.get("date") or training.get("start_date") or training.get("start_at")
+    )
+    if value is None:
+        return None
+    if isinstance(value, date) and not isinstance(value, datetime):
+        return value
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, str):
         try:
-            return json.loads(txt)
-        except Exception:
-            return {"raw": txt, "status": r.status}
-
-def _ok(data: Dict[str, Any], label: str):
-    return {"ok": True, **data}, f"{label}: ok"
-
-def _err(code: str, msg: str, label: str):
-    return {"ok": False, "error": {"code": code, "message": msg[:500]}}, f"{label}: error"
-
-async def user_summary_fetch(arguments: Dict[str, Any]):
-    user_id = _get(arguments, "user_id")
-    bearer = _auth_bearer(user_id)
-    if not bearer:
-        return _err("not_linked", "user_id не указан и токен не найден; сначала выполните линк или передайте user_id", "user.summary.fetch")
-    base = _base_pub()
-    url = f"{base}/profile/summary"
-    async with aiohttp.ClientSession() as s:
-        data = await _http_json(s, url, bearer)
-    return _ok({"summary": data}, "user.summary.fetch")
-
-async def user_last_training_fetch(arguments: Dict[str, Any]):
-    user_id = _get(arguments, "user_id")
-    bearer = _auth_bearer(user_id)
-    if not bearer:
-        return _err("not_linked", "user_id не указан и токен не найден; сначала выполните линк или передайте user_id", "user.last_training.fetch")
-    oldest = _get(arguments, "oldest")
-    newest = _get(arguments, "newest")
-    if not (oldest and newest):
-        oldest, newest = _window_14d()
-    base = _base_pub()
-    url = f"{base}/trainings?oldest={oldest}&newest={newest}"
-    async with aiohttp.ClientSession() as s:
-        data = await _http_json(s, url, bearer)
-    if isinstance(data, list):
-        payload = {"count": len(data), "items": data, "window": {"oldest": oldest, "newest": newest}}
-    else:
-        payload = {"data": data, "window": {"oldest": oldest, "newest": newest}}
-    return _ok(payload, "user.last_training.fetch")
+            return date.fromisoformat(value[:10])
+        except ValueError:
+            try:
+                return datetime.fromisoformat(value).date()
+            except ValueError:
+                return None
+    return None
+
+
+__all__ = ["ToolError", "call_tool", "get_tool_definitions", "has_tool"]
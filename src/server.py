@@ -1,298 +1,1531 @@
 # src/server.py
+"""Единый MCP-сервер STAS: JSON-RPC на /mcp + HTTP-обёртки тулов и ресурсов."""
+
 from __future__ import annotations
 
-import json
-from typing import Any, Awaitable, Callable, Dict, List, Tuple
-
-from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
-
-# ваши реализации тулов
-from src.mcp.tools_read import user_summary_fetch, user_last_training_fetch
-from src.mcp.tools_plan import (
-    plan_list,
-    plan_status,
-    plan_update,
-    plan_publish,
-    plan_delete,
-    plan_validate,
-)
+import asyncio
+import binascii
+import copy
+import logging
+import os
+import re
+import sys
+import time
+from time import monotonic
+from datetime import date, datetime, timedelta, timezone
+from functools import lru_cache
+from types import MappingProxyType
+from urllib.parse import parse_qsl
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Mapping, Optional, Tuple
+
+import httpx
+import orjson
+
+try:  # libuv-цикл: ~2x пропускной способности на IO-bound прокси
+    import uvloop
+except ImportError:  # pragma: no cover - окружение без uvloop (например, Windows)
+    uvloop = None
+else:
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import ORJSONResponse
+import fastjsonschema
+from jsonschema import Draft7Validator
+from jsonschema.validators import validator_for
+from sse_starlette.sse import EventSourceResponse
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.routing import Route
+from starlette.types import Receive, Scope, Send
+
+from src.config import settings
+from src.linking import get_status, set_linked, set_pending
+from src.mcp import resources_user, tools_plan_write_ext, tools_read, tools_session
+from src.routes import read_user
+from src.session import store as session_store
+from src.utils.plan_external_id import normalize_plan_external_id
 
-app = FastAPI(title="STAS MCP Server", version="2025.11.05")
+APP_VERSION = "2025.11.05"
+APP_PROTOCOL = "2024-11-05"
+GW_USER_AGENT = f"stas-mcp/{APP_VERSION}"
+
+DATA_DIR = Path(__file__).resolve().parent.parent / "data"
+LINKS_FILE = DATA_DIR / "links.json"
+AUDIT_FILE = DATA_DIR / "audit.log"
+SCHEMA_PATH = DATA_DIR / "schema.plan.json"
+
+# свой logger вместо logging.*-шорткатов: без похода к logging.root на вызов
+logger = logging.getLogger(__name__)
+
+app = FastAPI(
+    title="STAS MCP Server",
+    version=APP_VERSION,
+    default_response_class=ORJSONResponse,
+)
+# tools/list и крупные result'ы ужимаются ~5x; мелочь (healthz, ping) не трогаем
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+app.include_router(read_user.router)
 
 # ---------------- helpers ----------------
 Json = Dict[str, Any]
-AsyncTool = Callable[[Dict[str, Any]], Awaitable[Tuple[Json, str]]]
 
+_RPC_TOOL_ERRORS = (tools_read.ToolError, tools_plan_write_ext.ToolError)
 
-def _rpc_ok(id_: Any, payload: Json) -> Json:
-    return {"jsonrpc": "2.0", "id": id_, "result": payload}
 
+# CORS-семантика статична: вместо слоя CORSMiddleware на каждый запрос
+# штампуем константные заголовки прямо в ответы
+_PREFLIGHT_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Methods": "GET, POST, OPTIONS",
+    "Access-Control-Allow-Headers": "*",
+    "Access-Control-Max-Age": "600",
+}
+
+
+# Starlette копирует заголовки в свой raw-список при создании Response,
+# поэтому общий замороженный dict безопасен — минус аллокация на каждый ответ
+_BASE_MCP_HEADERS: Mapping[str, str] = MappingProxyType(
+    {"Cache-Control": "no-store", "Access-Control-Allow-Origin": "*"}
+)
+
+
+def _mcp_headers() -> Mapping[str, str]:
+    return _BASE_MCP_HEADERS
+
+
+# частый случай — коннектор прощупывает неизвестные тулы; константные куски
+# конверта закэшированы как байты, на каждый вызов кодируются только id и message
+_RPC_ENVELOPE_PREFIX = b'{"jsonrpc":"2.0","id":'
+_METHOD_NOT_FOUND_INFIX = b',"error":{"code":"MethodNotFound","message":'
+
+
+# результаты крупнее порога уходят несколькими body-кадрами: TCP начинает
+# отправку раньше и не ждёт склейки конверта с телом
+_STREAM_THRESHOLD = 64 * 1024
+
+
+class _ChunkedJSONResponse(Response):
+    def __init__(self, parts: Tuple[bytes, ...]) -> None:
+        self.parts = parts
+        super().__init__(
+            content=b"", media_type="application/json", headers=_mcp_headers()
+        )
+        self.headers["content-length"] = str(sum(len(p) for p in parts))
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send(
+            {
+                "type": "http.response.start",
+                "status": self.status_code,
+                "headers": self.raw_headers,
+            }
+        )
+        last = len(self.parts) - 1
+        for index, part in enumerate(self.parts):
+            await send(
+                {
+                    "type": "http.response.body",
+                    "body": part,
+                    "more_body": index < last,
+                }
+            )
+
+
+def _response_body(resp: Response) -> bytes:
+    parts = getattr(resp, "parts", None)
+    return b"".join(parts) if parts else resp.body
+
+
+def rpc_ok(id_: Any, payload: Any) -> Response:
+    # хендлеры отдают сырые dict'ы; единственная сериализация — здесь, одним
+    # C-проходом orjson
+    return _rpc_ok_bytes(id_, orjson.dumps(payload))
+
+
+def _rpc_ok_bytes(id_: Any, result_bytes: bytes) -> Response:
+    # кэш read-тулов хранит уже сериализованный result — конверт только склеиваем
+    id_bytes = orjson.dumps(id_)
+    if len(result_bytes) >= _STREAM_THRESHOLD:
+        prefix = _RPC_ENVELOPE_PREFIX + id_bytes + b',"result":'
+        return _ChunkedJSONResponse((prefix, result_bytes, b"}"))
+    return _spliced_response(
+        _RPC_ENVELOPE_PREFIX, id_bytes, b',"result":', result_bytes, b"}"
+    )
+
+
+def rpc_err(id_: Any, code: str, message: str, data: Any = None) -> Response:
+    # одно выражение вместо "собрать dict + условно дописать data"
+    err = (
+        {"code": code, "message": message}
+        if data is None
+        else {"code": code, "message": message, "data": data}
+    )
+    return _spliced_response(
+        _RPC_ENVELOPE_PREFIX, orjson.dumps(id_), b',"error":', orjson.dumps(err), b"}"
+    )
+
+
+def _spliced_response(*parts: bytes) -> Response:
+    return Response(
+        b"".join(parts),
+        media_type="application/json",
+        headers=_mcp_headers(),
+    )
 
-def _content(json_payload: Json, text: str) -> Json:
-    # контент для ChatGPT MCP: structured в type:"json" + подпись
-    return {
-        "content": [
-            {"type": "json", "json": json_payload},
-            {"type": "text", "text": text},
-        ]
-    }
+
+def _method_not_found(id_: Any, message: str) -> Response:
+    return _spliced_response(
+        _RPC_ENVELOPE_PREFIX,
+        orjson.dumps(id_),
+        _METHOD_NOT_FOUND_INFIX,
+        orjson.dumps(message),
+        b"}}",
+    )
+
+
+# тул-слой читает arguments как Mapping и не мутирует — пустой dict общий
+_EMPTY_ARGS: Json = {}
 
 
 def _args_to_obj(arguments: Any) -> Tuple[Dict[str, Any], bool]:
-    if arguments is None:
-        return {}, False
-    if isinstance(arguments, dict):
+    # обычный случай — уже dict; тип берём один раз и сравниваем указатели
+    t = type(arguments)
+    if t is dict:
         return arguments, False
-    if isinstance(arguments, str):
+    if arguments is None:
+        return _EMPTY_ARGS, False
+    if t is str or t is bytes:
+        # пустые/не-объектные строки отсекаем до парсера: raise+catch на
+        # порядки дороже проверки первого символа
+        stripped = arguments.strip()
+        if not stripped or stripped in ("{}", b"{}"):
+            return _EMPTY_ARGS, True
+        if (stripped[:1] != b"{") if t is bytes else (stripped[0] != "{"):
+            return _EMPTY_ARGS, True
         try:
-            return json.loads(arguments or "{}"), True
-        except Exception:
-            return {}, True
-    return {}, False
+            decoded = orjson.loads(stripped)
+        except orjson.JSONDecodeError:
+            return _EMPTY_ARGS, True
+        return (decoded, True) if type(decoded) is dict else (_EMPTY_ARGS, True)
+    return _EMPTY_ARGS, False
+
+
+# params никем не мутируются — безопасно шарить один пустой dict на все RPC
+_EMPTY_PARAMS: Json = {}
 
 
 def _okify(payload: Json) -> Json:
-    return payload if "ok" in payload else {"ok": True, **payload}
-
-
-# ---------------- registry ----------------
-TOOLS: Dict[str, AsyncTool] = {
-    # READ/SAFE
-    "user_summary_fetch": user_summary_fetch,
-    "user_last_training_fetch": user_last_training_fetch,
-    "plan_list": plan_list,
-    "plan_status": plan_status,
-    "plan_validate": plan_validate,
-    # WRITE/DANGEROUS (только при наличии Authorization)
-    "plan_update": plan_update,
-    "plan_publish": plan_publish,
-    "plan_delete": plan_delete,
-}
+    # хендлеры не переиспользуют payload — одна вставка ключа вместо копии dict
+    payload.setdefault("ok", True)
+    return payload
 
-ALIASES: Dict[str, str] = {
-    "user.summary.fetch": "user_summary_fetch",
-    "user.last_training.fetch": "user_last_training_fetch",
-    "plan.list": "plan_list",
-    "plan.status": "plan_status",
-    "plan.update": "plan_update",
-    "plan.publish": "plan_publish",
-    "plan.delete": "plan_delete",
-    "plan.validate": "plan_validate",
-}
 
-READ_ONLY = {
-    "user_summary_fetch",
-    "user_last_training_fetch",
-    "plan_list",
-    "plan_status",
-    "plan_validate",
-}
-WRITE_ONLY = {"plan_update", "plan_publish", "plan_delete"}
+# ---------------- schema / manifest ----------------
+# схема читается с диска один раз; байты отдаём ресурсом без переэнкода
+_SCHEMA_BYTES = SCHEMA_PATH.read_bytes()
+_SCHEMA_DICT: Json = orjson.loads(_SCHEMA_BYTES)
 
-BASE_OBJ: Json = {"type": "object"}
 
+def load_schema() -> Json:
+    # разделяемый dict: вызывающие не мутируют его (draft-копия делается отдельно)
+    return _SCHEMA_DICT
 
-def both_keys(schema_obj: Json) -> Json:
-    # публикуем схему под двумя ключами (совместимость разных билдов)
-    return {"inputSchema": schema_obj, "input_schema": schema_obj}
 
+PLAN_VALIDATOR = Draft7Validator(load_schema())
 
-TOOLS_SCHEMAS_ALL: List[Json] = [
-    {
-        "name": "user_summary_fetch",
-        "description": "Fetch user summary (read-only).",
-        **both_keys(
-            {
-                **BASE_OBJ,
-                "properties": {
-                    "user_id": {"type": "integer", "description": "Optional explicit user id."},
-                    "connection_id": {"type": "string", "description": "Optional chat connection id."},
-                },
-                "required": [],
-                "additionalProperties": False,
-            }
-        ),
-    },
-    {
-        "name": "user_last_training_fetch",
-        "description": "Return recent trainings (read-only).",
-        **both_keys(
-            {
-                **BASE_OBJ,
-                "properties": {
-                    "user_id": {"type": "integer"},
-                    "oldest": {"type": "string", "description": "YYYY-MM-DD"},
-                    "newest": {"type": "string", "description": "YYYY-MM-DD"},
-                    "connection_id": {"type": "string"},
-                },
-                "required": [],
-                "additionalProperties": False,
-            }
-        ),
-    },
-    {
-        "name": "plan_list",
-        "description": "List workout plan events (read-only).",
-        **both_keys(
-            {
-                **BASE_OBJ,
-                "properties": {
-                    "oldest": {"type": "string", "description": "YYYY-MM-DD"},
-                    "newest": {"type": "string", "description": "YYYY-MM-DD"},
-                    "category": {"type": "string", "enum": ["WORKOUT", "RECOVERY", "OTHER"]},
-                    "user_id": {"type": "integer"},
-                    "connection_id": {"type": "string"},
-                    "limit": {"type": "integer", "minimum": 1},
-                },
-                "required": [],
-                "additionalProperties": False,
-            }
-        ),
-    },
-    {"name": "plan_status", "description": "Get current plan status (read-only).", **both_keys({"type": "object"})},
-    {"name": "plan_validate", "description": "Validate plan consistency (read-only).", **both_keys({"type": "object"})},
+try:  # Rust-валидатор: обход плана без per-keyword диспатча в питоне
+    import jsonschema_rs as _jsonschema_rs
+except ImportError:  # pragma: no cover - окружение без jsonschema-rs
+    _jsonschema_rs = None
 
-    # WRITE (покажем только при Authorization)
-    {
-        "name": "plan_update",
-        "description": "Update plan entities (dangerous; requires confirm:true and Authorization).",
-        **both_keys(
-            {
-                **BASE_OBJ,
-                "properties": {
-                    "patch": {"type": "object"},
-                    "confirm": {"type": "boolean", "const": True, "description": "Must be true to proceed."},
-                    "reason": {"type": "string", "description": "Why this change is needed (for audit)."},
-                },
-                "required": ["patch", "confirm"],
-                "additionalProperties": False,
-            }
-        ),
-    },
-    {
-        "name": "plan_publish",
-        "description": "Publish pending changes (dangerous; requires confirm:true and Authorization).",
-        **both_keys(
-            {
-                **BASE_OBJ,
-                "properties": {
-                    "note": {"type": "string"},
-                    "confirm": {"type": "boolean", "const": True, "description": "Must be true to proceed."},
-                },
-                "required": ["confirm"],
-                "additionalProperties": False,
-            }
-        ),
-    },
+
+def _plan_errors(draft: Any) -> List[Json]:
+    return [
+        {"path": [str(p) for p in error.path], "message": error.message}
+        for error in PLAN_VALIDATOR.iter_errors(draft)
+    ]
+
+
+if _jsonschema_rs is not None:
+    _PLAN_VALIDATOR_RS = _jsonschema_rs.Draft7Validator(load_schema())
+
+    def _plan_errors(draft: Any) -> List[Json]:  # noqa: F811
+        return [
+            {"path": [str(p) for p in error.instance_path], "message": error.message}
+            for error in _PLAN_VALIDATOR_RS.iter_errors(draft)
+        ]
+
+
+def _draft_input_schema() -> Json:
+    # глубокая копия без сериализации: мутируем external_id, не трогая оригинал
+    schema = copy.deepcopy(load_schema())
+    ext = schema.get("properties", {}).get("external_id")
+    if isinstance(ext, dict):
+        ext.setdefault("description", "External ID of the plan")
+    return schema
+
+
+# схема immutable — считаем один раз, а не на каждый build_tools_for_rpc
+_DRAFT_SCHEMA = _draft_input_schema()
+
+
+# старые подчёркнутые имена всё ещё принимаются в tools/call;
+# таблицы-константы заморожены, чтобы fork-воркеры делили их copy-on-write
+ALIASES: Mapping[str, str] = MappingProxyType(
     {
-        "name": "plan_delete",
-        "description": "Delete a plan item (dangerous; requires confirm:true and Authorization).",
-        **both_keys(
-            {
-                **BASE_OBJ,
-                "properties": {
-                    "id": {"type": "string"},
-                    "confirm": {"type": "boolean", "const": True, "description": "Must be true to proceed."},
-                },
-                "required": ["id", "confirm"],
-                "additionalProperties": False,
-            }
+        "user_summary_fetch": "user.summary.fetch",
+        "user_last_training_fetch": "user.last_training.fetch",
+        "plan_list": "plan.list",
+        "plan_status": "plan.status",
+        "plan_update": "plan.update",
+    }
+)
+
+
+def _by_name(definitions) -> Dict[str, Json]:
+    return {
+        str(t.get("name") or t.get("id")).strip(): t
+        for t in definitions
+        if t.get("name") or t.get("id")
+    }
+
+
+def _merge_tool_definitions() -> List[Json]:
+    # один C-проход слияния, last-wins как у старого цикла
+    merged = {
+        **_by_name(tools_session.get_tool_definitions()),
+        **_by_name(tools_read.get_tool_definitions()),
+        **_by_name(tools_plan_write_ext.get_tool_definitions(_DRAFT_SCHEMA)),
+    }
+    return list(merged.values())
+
+
+# реестры статичны после импорта — список тулов и его JSON считаем один раз
+_TOOLS_LIST_CACHED = tuple(_merge_tool_definitions())
+
+
+def build_tools_for_rpc() -> List[Json]:
+    # merge сделан при импорте — внешним вызовам отдаём копию кэша
+    return list(_TOOLS_LIST_CACHED)
+
+
+_TOOLS_LIST_RESULT_JSON = orjson.dumps({"tools": _TOOLS_LIST_CACHED})
+_TOOLS_LIST_SUFFIX = b',"result":' + _TOOLS_LIST_RESULT_JSON + b"}"
+
+
+def _fastjsonschema_check(validate: Callable[[Any], Any]) -> Callable[[Json], Any]:
+    def check(arguments: Json) -> Optional[Tuple[str, List[str]]]:
+        try:
+            validate(arguments)
+        except fastjsonschema.JsonSchemaException as exc:
+            # path начинается с синтетического корня "data" — отрезаем
+            return exc.message, [str(p) for p in exc.path[1:]]
+        return None
+
+    return check
+
+
+def _jsonschema_check(validator: Any) -> Callable[[Json], Any]:
+    def check(arguments: Json) -> Optional[Tuple[str, List[str]]]:
+        error = next(validator.iter_errors(arguments), None)
+        if error is not None:
+            return error.message, [str(p) for p in error.path]
+        return None
+
+    return check
+
+
+def _compile_input_validators() -> Dict[str, Any]:
+    # fastjsonschema генерирует специализированный Python-код на схему;
+    # jsonschema остаётся фолбэком для схем, которые он не переваривает
+    compiled: Dict[str, Any] = {}
+    for tool in _TOOLS_LIST_CACHED:
+        schema = tool.get("inputSchema")
+        if not isinstance(schema, dict):
+            continue
+        name = tool["name"]
+        try:
+            compiled[name] = _fastjsonschema_check(fastjsonschema.compile(schema))
+        except fastjsonschema.JsonSchemaDefinitionException:
+            klass = validator_for(schema)
+            klass.check_schema(schema)
+            compiled[name] = _jsonschema_check(klass(schema))
+    return compiled
+
+
+INPUT_VALIDATORS = MappingProxyType(_compile_input_validators())
+
+
+def _tools_list_response(id_: Any) -> Response:
+    # единственная per-request работа — вклейка id между двумя константами
+    return _spliced_response(
+        _RPC_ENVELOPE_PREFIX, orjson.dumps(id_), _TOOLS_LIST_SUFFIX
+    )
+
+
+def build_manifest() -> Json:
+    return {
+        "name": "stas-mcp",
+        "version": APP_VERSION,
+        "protocolVersion": APP_PROTOCOL,
+        "tools": _TOOLS_LIST_CACHED,
+        "resources": resources_user.list_resources(),
+    }
+
+
+def _normalize_manifest_for_ui(manifest: Json) -> Json:
+    normalized = dict(manifest)
+    tools: List[Json] = []
+    for t in manifest.get("tools", []):
+        t = dict(t)
+        schema = t.get("inputSchema") or t.get("input_schema") or {"type": "object"}
+        t["inputSchema"] = schema
+        if settings.LEGACY_INPUT_SCHEMA:
+            # дубль под снейк-кейсом почти удваивает манифест — только по флагу
+            t.setdefault("input_schema", schema)
+        else:
+            t.pop("input_schema", None)
+        tools.append(t)
+    normalized["tools"] = tools
+    return normalized
+
+
+# манифест статичен после импорта — отдаём готовые байты без прохода
+# через jsonable_encoder/Pydantic. Response при этом на каждый запрос свой:
+# тело крупнее порога GZipMiddleware, а тот мутирует raw_headers ответа
+# in-place — разделяемый объект запоминал бы gzip-заголовки навсегда
+_MANIFEST_UI = _normalize_manifest_for_ui(build_manifest())
+_MANIFEST_BYTES = orjson.dumps(_MANIFEST_UI)
+
+
+def _manifest_response() -> Response:
+    return Response(
+        _MANIFEST_BYTES, media_type="application/json", headers=_mcp_headers()
+    )
+
+
+# ---------------- links / audit ----------------
+# links.json меняется только через _save_links — кэшируем разбор по mtime
+_LINKS_CACHE: Optional[Dict[str, Any]] = None
+_LINKS_MTIME: int = -1
+
+
+def _load_links() -> Dict[str, Any]:
+    global _LINKS_CACHE, _LINKS_MTIME
+    try:
+        mtime = LINKS_FILE.stat().st_mtime_ns
+    except FileNotFoundError:
+        _LINKS_CACHE, _LINKS_MTIME = None, -1
+        return {}
+    if _LINKS_CACHE is not None and mtime == _LINKS_MTIME:
+        return _LINKS_CACHE
+    try:
+        links = orjson.loads(LINKS_FILE.read_bytes())
+    except (FileNotFoundError, ValueError):
+        links = {}
+    _LINKS_CACHE, _LINKS_MTIME = links, mtime
+    return links
+
+
+def _save_links(links: Dict[str, Any]) -> None:
+    global _LINKS_CACHE, _LINKS_MTIME
+    LINKS_FILE.parent.mkdir(parents=True, exist_ok=True)
+    # атомарная запись: никто не прочитает полфайла, кэш валиден сразу
+    tmp = LINKS_FILE.with_suffix(".tmp")
+    tmp.write_bytes(orjson.dumps(links, option=orjson.OPT_INDENT_2))
+    os.replace(tmp, LINKS_FILE)
+    _LINKS_CACHE, _LINKS_MTIME = links, LINKS_FILE.stat().st_mtime_ns
+
+
+# аудит пишет фоновая задача: сериализация в хендлере, I/O — пачками вне его
+_AUDIT_QUEUE: Optional["asyncio.Queue[bytes]"] = None
+_AUDIT_TASK: Optional["asyncio.Task[None]"] = None
+
+# предкомпилированный формат вместо разбора "%Y-%m-%dT%H:%M:%SZ" на каждый вызов
+_ISO_Z = "{0:04d}-{1:02d}-{2:02d}T{3:02d}:{4:02d}:{5:02d}Z".format
+
+
+def _utc_now_iso(_gmtime=time.gmtime) -> str:
+    t = _gmtime()
+    return _ISO_Z(t.tm_year, t.tm_mon, t.tm_mday, t.tm_hour, t.tm_min, t.tm_sec)
+
+
+def _append_audit(entry: Json) -> None:
+    line = orjson.dumps(entry) + b"\n"
+    if _AUDIT_QUEUE is not None:
+        _AUDIT_QUEUE.put_nowait(line)
+        return
+    # вне жизненного цикла приложения (скрипты, ранний импорт) — синхронно
+    AUDIT_FILE.parent.mkdir(parents=True, exist_ok=True)
+    with AUDIT_FILE.open("ab") as fh:
+        fh.write(line)
+
+
+# пачка ограничена: при всплеске пишем кусками, а не одним гигантским join'ом
+_AUDIT_BATCH_MAX = 100
+
+
+def _drain_nowait(queue: "asyncio.Queue[bytes]", batch: List[bytes]) -> List[bytes]:
+    while len(batch) < _AUDIT_BATCH_MAX:
+        try:
+            batch.append(queue.get_nowait())
+        except asyncio.QueueEmpty:
+            break
+    return batch
+
+
+async def _audit_writer(queue: "asyncio.Queue[bytes]") -> None:
+    AUDIT_FILE.parent.mkdir(parents=True, exist_ok=True)
+    with AUDIT_FILE.open("ab") as fh:
+        while True:
+            try:
+                batch = _drain_nowait(queue, [await queue.get()])
+            except asyncio.CancelledError:
+                while True:
+                    tail = _drain_nowait(queue, [])
+                    if not tail:
+                        break
+                    fh.write(b"".join(tail))
+                raise
+            fh.write(b"".join(batch))
+            fh.flush()
+
+
+def _resolve_user_id(connection_id: Optional[str]) -> str:
+    if connection_id:
+        links = _load_links()
+        uid = links.get(connection_id)
+        if uid:
+            return str(uid)
+        status = get_status(connection_id)
+        if status.get("linked") and status.get("user_id") is not None:
+            return str(status["user_id"])
+    uid = session_store.get_user_id()
+    if uid is not None:
+        return str(uid)
+    raise HTTPException(
+        status_code=403, detail={"ok": False, "error": "linking_required"}
+    )
+
+
+# ---------------- gateway ----------------
+HTTP_CLIENT: Optional[httpx.AsyncClient] = None
+
+
+@app.on_event("startup")
+async def _startup() -> None:
+    global HTTP_CLIENT, _AUDIT_QUEUE, _AUDIT_TASK, _PING_EVENT, _PING_TASK, _PING_DATA
+    _AUDIT_QUEUE = asyncio.Queue()
+    _AUDIT_TASK = asyncio.create_task(_audit_writer(_AUDIT_QUEUE))
+    # Event привязан к циклу — пересоздаём вместе с тикером
+    _PING_EVENT = asyncio.Event()
+    _PING_DATA = '{"ts":%d}' % int(time.time())
+    _PING_TASK = asyncio.create_task(_ping_ticker(_PING_EVENT))
+    _READ_CACHE.clear()
+    _INFLIGHT.clear()  # Future'ы привязаны к циклу предыдущего запуска
+    _DRY_RUN_CACHE.clear()
+    _TOOL_SEMS.clear()
+    for tool_name, limit in _TOOL_CONC_LIMITS.items():
+        if limit > 0:
+            _TOOL_SEMS[tool_name] = asyncio.Semaphore(limit)
+    # HTTP/2 мультиплексирует конкурентные gw-вызовы по одному TLS-соединению;
+    # keepalive_expiry держит сессию тёплой между всплесками
+    HTTP_CLIENT = httpx.AsyncClient(
+        base_url=settings.BRIDGE_BASE,
+        http2=True,
+        timeout=httpx.Timeout(30.0, connect=5.0),
+        limits=httpx.Limits(
+            max_connections=200,
+            max_keepalive_connections=100,
+            keepalive_expiry=30.0,
         ),
-    },
-]
+    )
 
-# ---------------- health ----------------
-@app.get("/healthz")
-async def healthz():
-    return {"ok": True, "service": "stas-mcp", "version": app.version}
 
+@app.on_event("shutdown")
+async def _shutdown() -> None:
+    global HTTP_CLIENT, _AUDIT_QUEUE, _AUDIT_TASK, _PING_EVENT, _PING_TASK
+    if _PING_TASK is not None:
+        _PING_TASK.cancel()
+        try:
+            await _PING_TASK
+        except asyncio.CancelledError:
+            pass
+        _PING_EVENT = None
+        _PING_TASK = None
+    if _AUDIT_TASK is not None:
+        _AUDIT_TASK.cancel()  # writer дописывает хвост очереди перед выходом
+        try:
+            await _AUDIT_TASK
+        except asyncio.CancelledError:
+            pass
+        _AUDIT_QUEUE = None
+        _AUDIT_TASK = None
+    if HTTP_CLIENT is not None:
+        await HTTP_CLIENT.aclose()
+        HTTP_CLIENT = None
 
-@app.get("/sse")
-async def sse_stub():
-    return JSONResponse({"ok": True, "sse": "noop"})
 
+_URLSAFE_TBL = bytes.maketrans(b"+/", b"-_")
 
-# ---------------- MCP endpoint ----------------
-@app.post("/mcp")
-async def mcp(request: Request):
-    body = await request.json()
-    id_ = body.get("id")
-    method = body.get("method")
-    params = body.get("params") or {}
 
-    # наличие Authorization считаем признаком аутентификации
-    has_auth = bool(request.headers.get("authorization"))
+@lru_cache(maxsize=2048)
+def _bearer(uid: str) -> str:
+    # отображение uid -> токен чистое, users немного — мемоизируем;
+    # на промахе собираем токен без dict, json-дампа и rstrip-аллокации
+    raw = b'{"uid":%d}' % int(uid)
+    encoded = binascii.b2a_base64(raw, newline=False).translate(_URLSAFE_TBL)
+    pad = (-len(raw)) % 3
+    token = encoded[:-pad] if pad else encoded
+    return "t_" + token.decode("ascii")
 
+
+async def gw(
+    method: str,
+    path: str,
+    *,
+    uid: str,
+    params: Optional[Dict[str, Any]] = None,
+    json_payload: Optional[Json] = None,
+    ua: str = GW_USER_AGENT,
+) -> Any:
+    client = HTTP_CLIENT
+    owns_client = client is None
+    if owns_client:
+        client = httpx.AsyncClient(
+            base_url=settings.BRIDGE_BASE, timeout=httpx.Timeout(30.0, connect=5.0)
+        )
     try:
-        if method == "initialize":
-            return _rpc_ok(
-                id_,
+        resp = await client.request(
+            method,
+            path,
+            params={"user_id": uid, **(params or {})},
+            headers={"Authorization": f"Bearer {_bearer(uid)}", "User-Agent": ua},
+            json=json_payload,
+        )
+    except httpx.RequestError as exc:
+        raise HTTPException(
+            status_code=502, detail={"ok": False, "error": "gateway_unavailable"}
+        ) from exc
+    finally:
+        if owns_client:
+            await client.aclose()
+
+    if resp.status_code >= 400:
+        raise HTTPException(
+            status_code=502,
+            detail={
+                "ok": False,
+                "error": "gateway_error",
+                "status": resp.status_code,
+            },
+        )
+    try:
+        # orjson по сырым байтам вместо stdlib-пути httpx — крупные /trainings
+        # парсятся заметно быстрее
+        return orjson.loads(resp.content)
+    except orjson.JSONDecodeError as exc:
+        raise HTTPException(
+            status_code=502, detail={"ok": False, "error": "gateway_bad_json"}
+        ) from exc
+
+
+# ---------------- plan helpers ----------------
+def _event_name(day: Any, block: Any = None) -> str:
+    if isinstance(block, dict):
+        title = block.get("title")
+        if isinstance(title, str):
+            stripped = title.strip()
+            if stripped:
+                return stripped
+    if isinstance(day, dict):
+        title = day.get("title")
+        if isinstance(title, str):
+            stripped = title.strip()
+            if stripped:
+                return stripped
+    return "Workout"
+
+
+def _build_events(external_id: str, days: Any) -> List[Json]:
+    events: List[Json] = []
+    if not isinstance(days, list):
+        return events
+    append = events.append  # локальный алиас: без LOAD_ATTR в цикле по дням
+    for day in days:
+        if not isinstance(day, dict):
+            continue
+        day_date = day.get("date")
+        if not isinstance(day_date, str) or not day_date.strip():
+            continue
+        start = day_date.strip()[:10] + "T09:00:00"
+        day_description = day.get("description")
+        if not isinstance(day_description, str):
+            day_description = ""
+        raw_blocks = day.get("blocks")
+        blocks = (
+            tuple(b for b in raw_blocks if isinstance(b, dict))
+            if isinstance(raw_blocks, list)
+            else ()
+        )
+        if not blocks:
+            append(
                 {
-                    "protocolVersion": "2024-11-05",
-                    "capabilities": {"tools": {"listChanged": False}},
-                    "serverInfo": {"name": "stas-mcp", "version": app.version},
-                },
+                    "category": "WORKOUT",
+                    "external_id": external_id,
+                    "start_date_local": start,
+                    "name": _event_name(day, None),
+                    "description": day_description,
+                }
             )
+            continue
+        for block in blocks:
+            # блоки уже отфильтрованы до dict — isinstance в теле не нужен
+            description = block.get("description")
+            if not isinstance(description, str):
+                description = day_description
+            append(
+                {
+                    "category": "WORKOUT",
+                    "external_id": external_id,
+                    "start_date_local": start,
+                    "name": _event_name(day, block),
+                    "description": description,
+                }
+            )
+    return events
 
-        if method == "tools/list":
-            # БЕЗ AUTH — ПУБЛИКУЕМ НОЛЬ ИНСТРУМЕНТОВ (проходим safety)
-            if not has_auth:
-                return _rpc_ok(id_, {"tools": []})
-            # С AUTH — публикуем всё (read + write)
-            return _rpc_ok(id_, {"tools": TOOLS_SCHEMAS_ALL})
-
-        if method == "tools/call":
-            name_in = params.get("name")
-            raw_args = params.get("arguments")
-            args, was_string = _args_to_obj(raw_args)
-
-            name = ALIASES.get(name_in, name_in)
-
-            # блокируем write-вызовы без Auth (на всякий случай)
-            if (name in WRITE_ONLY) and not has_auth:
-                return _rpc_ok(
-                    id_,
-                    _content(
-                        {"ok": False, "error": {"code": "auth_required", "message": "write tools require Authorization"}},
-                        f"{name}: error",
-                    ),
-                )
 
-            handler: AsyncTool | None = TOOLS.get(name)
-            if not handler:
-                return _rpc_ok(
-                    id_,
-                    _content(
-                        {"ok": False, "error": {"code": "tool_not_found", "name": name_in}},
-                        f"{name_in}: error",
-                    ),
-                )
+def _unique_days(events: List[Json]) -> int:
+    # один проход и один set вместо пары set-comprehension'ов
+    days: set = set()
+    add = days.add
+    for event in events:
+        if isinstance(event, dict):
+            day = str(event.get("start_date_local", ""))[:10]
+            if day:
+                add(day)
+    return len(days)
+
+
+try:  # C-парсер ISO-8601: на порядок быстрее fromisoformat на больших выборках
+    from ciso8601 import parse_datetime as _parse_iso_c
+except ImportError:  # pragma: no cover - окружение без ciso8601
+    _parse_iso_c = None
+
+
+def _parse_iso(value: Any) -> Optional[datetime]:
+    if _parse_iso_c is not None:
+        try:
+            parsed = _parse_iso_c(str(value))
+        except ValueError:
+            return None
+    else:
+        try:
+            parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+_DATETIME_MIN_UTC = datetime.min.replace(tzinfo=timezone.utc)
+_TRAINING_DATE_FIELDS = ("date", "start_date", "start_at", "updated_at")
+
+
+def _pick_last_training(items: List[Any]) -> Optional[Json]:
+    # один проход без промежуточного pool-списка; каждый item ключуется один раз
+    best: Optional[Json] = None
+    best_key = _DATETIME_MIN_UTC
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        key = _DATETIME_MIN_UTC
+        for field in _TRAINING_DATE_FIELDS:
+            value = item.get(field)
+            if value is None:
+                continue
+            parsed = _parse_iso(value)
+            if parsed is not None:
+                key = parsed
+                break
+        if best is None or key > best_key:
+            best, best_key = item, key
+    return best
+
+
+# скомпилированный паттерн: без похода в кэш модуля re на каждый вызов
+_PLAN_EXT_RE = re.compile(r"plan:(\d{4})-w(\d{2})")
+
+
+def _window_for_external(external_id: Optional[str]) -> Tuple[str, str]:
+    match = _PLAN_EXT_RE.fullmatch(external_id or "")
+    if match:
+        try:
+            start = date.fromisocalendar(int(match.group(1)), int(match.group(2)), 1)
+        except ValueError:
+            start = None
+        if start is not None:
+            return start.isoformat(), (start + timedelta(days=6)).isoformat()
+    today = date.today()
+    return (
+        (today - timedelta(days=90)).isoformat(),
+        (today + timedelta(days=7)).isoformat(),
+    )
+
+
+# ---------------- health / sse ----------------
+# Response без состояния — один и тот же объект обслуживает все пробы
+_HEALTHZ_RESPONSE = Response(
+    orjson.dumps({"ok": True, "service": "stas-mcp", "version": APP_VERSION}),
+    media_type="application/json",
+)
+app.router.routes.append(Route("/healthz", _HEALTHZ_RESPONSE, methods=["GET"]))
+
+
+def _sse_manifest() -> Json:
+    return {
+        "resources": [
+            {"name": name, "path": f"/mcp/resource/{name}"}
+            for name in ("current.json", "last_training.json", "schema.plan.json")
+        ],
+        "tools": [
+            {"name": f"plan.{op}", "path": f"/mcp/tool/plan.{op}", "method": "POST"}
+            for op in ("validate", "publish", "delete")
+        ],
+    }
+
+
+# манифест для SSE одинаков для всех подключений — сериализуем один раз;
+# sse-starlette читает dict события, не мутируя его, так что объект общий
+_SSE_MANIFEST_DATA = orjson.dumps(_sse_manifest()).decode("utf-8")
+_SSE_MANIFEST_EVENT = {"event": "manifest", "data": _SSE_MANIFEST_DATA}
+
+
+# один общий тикер вместо asyncio.sleep(15) на каждое подключение: N стримов
+# просыпаются от одного таймера, и пейлоад форматируется один раз за тик
+_PING_INTERVAL = 15.0
+_PING_EVENT: Optional[asyncio.Event] = None
+_PING_TASK: Optional["asyncio.Task[None]"] = None
+_PING_DATA = ""
+
+
+async def _ping_ticker(event: asyncio.Event) -> None:
+    global _PING_DATA
+    while True:
+        await asyncio.sleep(_PING_INTERVAL)
+        # пейлоад пинга — один int: собрать строку дешевле, чем гонять сериализатор
+        _PING_DATA = '{"ts":%d}' % int(time.time())
+        event.set()  # set будит всех ждущих даже при немедленном clear
+        event.clear()
+
+
+async def _sse_event_generator(request: Request):
+    yield _SSE_MANIFEST_EVENT
+    yield {"event": "ping", "data": '{"ts":%d}' % int(time.time())}
+    while True:
+        event = _PING_EVENT
+        if event is not None:
+            await event.wait()
+            data = _PING_DATA
+        else:  # вне жизненного цикла приложения — свой таймер
+            await asyncio.sleep(_PING_INTERVAL)
+            data = '{"ts":%d}' % int(time.time())
+        if await request.is_disconnected():
+            break
+        yield {"event": "ping", "data": data}
+
+
+@app.get("/sse")
+async def sse(request: Request):
+    return EventSourceResponse(_sse_event_generator(request))
+
+
+# ---------------- linking ----------------
+def _link_status_response(connection_id: str) -> Response:
+    # готовый Response минует jsonable_encoder — остальные ручки уже так делают
+    body = orjson.dumps({"connection_id": connection_id, **get_status(connection_id)})
+    return Response(body, media_type="application/json")
+
+
+@app.get("/_link")
+@app.get("/link")
+async def link(connection_id: str = Query(...)):
+    set_pending(connection_id)
+    return _link_status_response(connection_id)
+
+
+@app.post("/link")
+async def link_complete(request: Request):
+    body = orjson.loads(await request.body())
+    if not isinstance(body, dict):
+        raise HTTPException(status_code=422, detail="body must be an object")
+    connection_id = str(body.get("connection_id") or "").strip()
+    raw_user_id = body.get("user_id")
+    if not connection_id or raw_user_id is None:
+        raise HTTPException(
+            status_code=422, detail="connection_id and user_id are required"
+        )
+    try:
+        user_id = int(raw_user_id)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=422, detail="user_id must be an integer")
+    set_linked(connection_id, user_id)
+    links = _load_links()
+    links[connection_id] = str(user_id)
+    _save_links(links)
+    return _link_status_response(connection_id)
+
+
+@app.get("/_whoami")
+@app.get("/whoami")
+async def whoami(connection_id: str = Query(...)):
+    return _link_status_response(connection_id)
+
+
+# ---------------- MCP manifest / RPC ----------------
+def _scope_query_params(scope: Dict[str, Any]) -> Dict[str, str]:
+    # распарсенный query кэшируем прямо в scope — batch из нескольких plan.*
+    # вызовов парсит строку один раз
+    params = scope.get("_qp")
+    if params is None:
+        query_string = scope.get("query_string", b"")
+        params = (
+            dict(parse_qsl(query_string.decode("latin-1"))) if query_string else {}
+        )
+        scope["_qp"] = params
+    return params
+
+
+def _connection_id_for(scope: Dict[str, Any], arguments: Dict[str, Any]) -> Optional[str]:
+    # scope["headers"] — список пар байтов; один проход вместо мультисловаря
+    primary = fallback = None
+    for key, value in scope["headers"]:
+        if key == b"x-connection-id":
+            primary = value
+            break
+        if key == b"x-conn" and fallback is None:
+            fallback = value
+    raw = primary or fallback
+    if raw:
+        return raw.decode("latin-1")
+    return _scope_query_params(scope).get("cid") or arguments.get("connection_id")
+
+
+def _rpc_user_id(arguments: Dict[str, Any], connection_id: Optional[str]) -> Any:
+    value = arguments.get("user_id")
+    if value is None:
+        value = session_store.get_user_id()
+    if value is None and connection_id:
+        status = get_status(connection_id)
+        if status.get("linked"):
+            value = status.get("user_id")
+    if value is None:
+        raise tools_read.ToolError(
+            "InvalidParams",
+            "user_id is required; call session.set_user_id(user_id) first",
+        )
+    return value
+
+
+# короткий TTL-кэш для идемпотентных read-тулов: повторные вызовы в рамках
+# одного хода диалога не ходят в шлюз
+_READ_CACHE_TTL = 5.0
+_READ_CACHE_MAX = 256
+_READ_CACHE: Dict[Tuple[Any, ...], Tuple[float, bytes]] = {}
+# однопроцессный asyncio: конкурентные одинаковые read-вызовы ждут один Future
+_INFLIGHT: Dict[Tuple[Any, ...], "asyncio.Future[bytes]"] = {}
+_CACHEABLE_READ_TOOLS = frozenset(
+    {"user.summary.fetch", "user.last_training.fetch", "plan.status", "plan.list"}
+)
+
+
+async def _cached_tool_call(
+    name: str,
+    handler: Callable[..., Awaitable[Any]],
+    arguments: Dict[str, Any],
+    scope: Dict[str, Any],
+) -> bytes:
+    # возвращает сериализованный result: попадание в кэш не платит за orjson.dumps
+    try:
+        # сериализованный ключ хэшируем как bytes — вложенные dict'ы в
+        # аргументах не выбивают кэш, в отличие от tuple(sorted(...))
+        key = (
+            name,
+            session_store.get_user_id(),
+            _connection_id_for(scope, arguments),
+            orjson.dumps(arguments, option=orjson.OPT_SORT_KEYS),
+        )
+    except TypeError:  # несериализуемые аргументы — мимо кэша
+        return orjson.dumps(await handler(name, arguments, scope))
+    now = monotonic()
+    hit = _READ_CACHE.get(key)
+    if hit is not None and now - hit[0] < _READ_CACHE_TTL:
+        return hit[1]
+    pending = _INFLIGHT.get(key)
+    if pending is not None:
+        # идентичный вызов уже в полёте — не плодим второй round-trip
+        return await pending
+    future: "asyncio.Future[bytes]" = asyncio.get_running_loop().create_future()
+    _INFLIGHT[key] = future
+    try:
+        result_bytes = orjson.dumps(await handler(name, arguments, scope))
+    except BaseException as exc:
+        future.set_exception(exc)
+        future.exception()  # retrieved: без "exception never retrieved" в логах
+        raise
+    finally:
+        _INFLIGHT.pop(key, None)
+    future.set_result(result_bytes)
+    if len(_READ_CACHE) >= _READ_CACHE_MAX:
+        cutoff = monotonic() - _READ_CACHE_TTL
+        for stale in [k for k, (ts, _) in _READ_CACHE.items() if ts < cutoff]:
+            del _READ_CACHE[stale]
+        while len(_READ_CACHE) >= _READ_CACHE_MAX:
+            # всё свежее — предел жёсткий, выселяем самую старую запись
+            del _READ_CACHE[next(iter(_READ_CACHE))]
+    # pop перед вставкой: порядок dict остаётся порядком старшинства
+    _READ_CACHE.pop(key, None)
+    _READ_CACHE[key] = (now, result_bytes)
+    return result_bytes
+
+
+async def _call_session_tool(name: str, arguments: Dict[str, Any], scope: Dict[str, Any]) -> Any:
+    return await tools_session.call_tool(name, arguments)
+
+
+async def _call_read_tool(name: str, arguments: Dict[str, Any], scope: Dict[str, Any]) -> Any:
+    return await tools_read.call_tool(name, arguments)
+
+
+async def _call_plan_write_tool(
+    name: str, arguments: Dict[str, Any], scope: Dict[str, Any]
+) -> Any:
+    # connection_id нужен только plan.* — читаем заголовки лениво
+    connection_id = _connection_id_for(scope, arguments)
+    user_id = _rpc_user_id(arguments, connection_id)
+    return await tools_plan_write_ext.call_tool(
+        name, arguments, user_id=user_id, connection_id=connection_id
+    )
+
+
+def _build_tool_dispatch() -> Dict[str, Callable[..., Awaitable[Any]]]:
+    # один dict-lookup вместо трёх has_tool-проб на каждый tools/call
+    table: Dict[str, Callable[..., Awaitable[Any]]] = {}
+    for tool in _TOOLS_LIST_CACHED:
+        name = tool["name"]
+        if tools_session.has_tool(name):
+            table[name] = _call_session_tool
+        elif tools_read.has_tool(name):
+            table[name] = _call_read_tool
+        elif tools_plan_write_ext.has_tool(name):
+            table[name] = _call_plan_write_tool
+    return table
+
+
+TOOL_DISPATCH = MappingProxyType(
+    {sys.intern(k): v for k, v in _build_tool_dispatch().items()}
+)
+
+
+def _tool_conc_limit(name: str) -> int:
+    # лимит фан-аута на тул: MCP_CONC_PLAN_LIST=8 и т.п.; 0 — без ограничения
+    env_key = "MCP_CONC_" + re.sub(r"[^A-Z0-9]+", "_", name.upper())
+    try:
+        return int(os.getenv(env_key, "16"))
+    except ValueError:
+        return 16
+
+
+_TOOL_CONC_LIMITS = {name: _tool_conc_limit(name) for name in TOOL_DISPATCH}
+# семафоры пересоздаются в startup: примитивы asyncio привязываются к циклу
+_TOOL_SEMS: Dict[str, asyncio.Semaphore] = {}
+_tool_sems_get = _TOOL_SEMS.get
+
+
+def _build_flat_dispatch() -> Dict[str, Tuple[str, Callable[..., Awaitable[Any]], Any]]:
+    # плоская таблица: и канонические имена, и алиасы ведут сразу к тройке
+    # (каноническое имя, handler, компилированный валидатор) — один lookup
+    # на tools/call вместо трёх
+    flat = {
+        name: (name, handler, INPUT_VALIDATORS.get(name))
+        for name, handler in TOOL_DISPATCH.items()
+    }
+    for alias, canon in ALIASES.items():
+        if canon in TOOL_DISPATCH:
+            flat[sys.intern(alias)] = flat[canon]
+    return flat
+
+
+# пред-связанный метод горячего словаря: без LOAD_ATTR на каждый вызов;
+# ключи интернированы — lookup по interned-строке сводится к сравнению указателей
+_flat_dispatch_get = _build_flat_dispatch().get
+
 
+# результат initialize неизменен — готовый хвост конверта вместо пяти dict'ов
+_INITIALIZE_SUFFIX = (
+    b',"result":'
+    + orjson.dumps(
+        {
+            "protocolVersion": APP_PROTOCOL,
+            "capabilities": {
+                "tools": {"listChanged": False},
+                "resources": {"listChanged": False},
+            },
+            "serverInfo": {"name": "stas-mcp", "version": APP_VERSION},
+        }
+    )
+    + b"}"
+)
+
+
+async def _rpc_initialize(rpc_id: Any, body: Json, scope: Dict[str, Any]) -> Response:
+    return _spliced_response(
+        _RPC_ENVELOPE_PREFIX, orjson.dumps(rpc_id), _INITIALIZE_SUFFIX
+    )
+
+
+async def _rpc_tools_list(rpc_id: Any, body: Json, scope: Dict[str, Any]) -> Response:
+    return _tools_list_response(rpc_id)
+
+
+async def _rpc_tools_call(
+    rpc_id: Any,
+    body: Json,
+    scope: Dict[str, Any],
+    # горячие глобалы связаны как default-аргументы: LOAD_FAST вместо LOAD_GLOBAL
+    _dispatch_get: Any = _flat_dispatch_get,
+    _cacheable: frozenset = _CACHEABLE_READ_TOOLS,
+) -> Response:
+    params = body.get("params") or _EMPTY_PARAMS
+    name_in = params.get("name")
+    if type(name_in) is not str:
+        return _method_not_found(rpc_id, f"Unknown tool '{name_in}'")
+    entry = _dispatch_get(name_in)
+    if entry is None:
+        return _method_not_found(rpc_id, f"Unknown tool '{name_in}'")
+    name, handler, check = entry
+    arguments, args_were_string = _args_to_obj(params.get("arguments"))
+    if args_were_string and logger.isEnabledFor(logging.WARNING):
+        logger.warning("tools/call: string arguments decoded for %r", name)
+
+    if check is not None:
+        violation = check(arguments)
+        if violation is not None:
+            message, path = violation
+            return rpc_err(rpc_id, "InvalidParams", message, {"path": path})
+
+    sem = _tool_sems_get(name)
+    if sem is None:
+        if name in _cacheable:
+            return _rpc_ok_bytes(
+                rpc_id, await _cached_tool_call(name, handler, arguments, scope)
+            )
+        return rpc_ok(rpc_id, await handler(name, arguments, scope))
+    # backpressure: всплеск одинаковых вызовов не раздувает фан-аут к gateway
+    async with sem:
+        if name in _cacheable:
+            return _rpc_ok_bytes(
+                rpc_id, await _cached_tool_call(name, handler, arguments, scope)
+            )
+        return rpc_ok(rpc_id, await handler(name, arguments, scope))
+
+
+# список ресурсов статичен после импорта — как и tools/list, хвост готов заранее
+_RESOURCES_LIST_SUFFIX = (
+    b',"result":' + orjson.dumps({"resources": resources_user.list_resources()}) + b"}"
+)
+
+
+async def _rpc_resources_list(
+    rpc_id: Any, body: Json, scope: Dict[str, Any]
+) -> Response:
+    return _spliced_response(
+        _RPC_ENVELOPE_PREFIX, orjson.dumps(rpc_id), _RESOURCES_LIST_SUFFIX
+    )
+
+
+async def _rpc_resources_read(
+    rpc_id: Any, body: Json, scope: Dict[str, Any]
+) -> Response:
+    uri = (body.get("params") or _EMPTY_PARAMS).get("uri")
+    if type(uri) is not str:
+        return rpc_err(rpc_id, "ResourceNotFound", f"Unknown resource '{uri}'")
+    return rpc_ok(rpc_id, await resources_user.read_resource(uri))
+
+
+# одна dict-проба вместо каскада сравнений строк; ключи из JSON уже str
+_RPC_METHODS: Dict[str, Callable[..., Awaitable[Response]]] = {
+    "initialize": _rpc_initialize,
+    "tools/list": _rpc_tools_list,
+    "tools/call": _rpc_tools_call,
+    "resources/list": _rpc_resources_list,
+    "resources/read": _rpc_resources_read,
+}
+_RPC_METHODS = MappingProxyType({sys.intern(k): v for k, v in _RPC_METHODS.items()})
+_rpc_method_get = _RPC_METHODS.get
+
+
+def _short_err(exc: BaseException) -> str:
+    # не материализуем многокилобайтные сообщения целиком ради первых 500 байт
+    try:
+        message = exc.args[0] if exc.args else type(exc).__name__
+    except Exception:
+        message = type(exc).__name__
+    text = message if isinstance(message, str) else repr(message)
+    return text if len(text) <= 500 else text[:500]
+
+
+async def _dispatch_rpc(raw_body: bytes, scope: Dict[str, Any]) -> Response:
+    # один проход C-декодера по сырым байтам вместо request.json()
+    try:
+        body = orjson.loads(raw_body)
+    except orjson.JSONDecodeError:
+        return rpc_err(None, "ParseError", "body is not valid JSON")
+    if type(body) is list:
+        # batch: подзапросы конкурентно, один общий parse/encode на N вызовов
+        if not body:
+            return rpc_err(None, "InvalidRequest", "batch must not be empty")
+        if len(body) == 1:
+            # одиночный batch не платит за планирование gather
+            responses = (await _dispatch_obj(body[0], scope),)
+        else:
+            responses = await asyncio.gather(
+                *(_dispatch_obj(item, scope) for item in body)
+            )
+        return Response(
+            b"[" + b",".join(_response_body(r) for r in responses) + b"]",
+            media_type="application/json",
+            headers=_mcp_headers(),
+        )
+    return await _dispatch_obj(body, scope)
+
+
+async def _dispatch_obj(
+    body: Any,
+    scope: Dict[str, Any],
+    # та же связка default-аргументом, что и в _rpc_tools_call
+    _method_get: Any = _rpc_method_get,
+) -> Response:
+    if not isinstance(body, dict):
+        return rpc_err(None, "InvalidRequest", "request must be an object")
+    body_get = body.get
+    rpc_id = body_get("id")
+    method = body_get("method")
+    # method из orjson всегда ровно str — точная проверка типа, как в tools/call
+    handler = _method_get(method) if type(method) is str else None
+    if handler is None:
+        return _method_not_found(rpc_id, f"Unsupported method '{method}'")
+
+    try:
+        # params достают только те хендлеры, которым они нужны
+        return await handler(rpc_id, body, scope)
+    except _RPC_TOOL_ERRORS as exc:
+        return rpc_err(rpc_id, exc.code, exc.message, exc.data)
+    except resources_user.ResourceError as exc:
+        return rpc_err(rpc_id, exc.code, exc.message, exc.data)
+    except Exception as exc:  # pragma: no cover - defensive
+        logger.exception("mcp rpc failed: method=%r", method)
+        return rpc_err(rpc_id, "InternalError", _short_err(exc))
+
+
+_MAX_RPC_BODY = 1 << 20  # MCP-запросы маленькие; всё крупнее — мусор
+
+
+async def _read_body(receive: Receive, limit: int = _MAX_RPC_BODY) -> bytes:
+    # типичный запрос приходит одним кадром — без цикла и склейки
+    message = await receive()
+    body = message.get("body", b"")
+    if not message.get("more_body"):
+        if len(body) > limit:
+            raise ValueError("request body too large")
+        return body
+    chunks = [body]
+    total = len(body)
+    while True:
+        message = await receive()
+        chunk = message.get("body", b"")
+        chunks.append(chunk)
+        total += len(chunk)
+        if total > limit:
+            raise ValueError("request body too large")
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+class _MCPEndpoint:
+    """Чистый ASGI-эндпоинт /mcp: без Request/зависимостей Starlette на hot path."""
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        method = scope["method"]
+        if method == "POST":
             try:
-                payload, text = await handler(args)
-                payload = _okify(payload)
-                return _rpc_ok(id_, _content(payload, text or f"{name}: ok"))
-            except Exception as e:
-                return _rpc_ok(
-                    id_,
-                    _content(
-                        {
-                            "ok": False,
-                            "error": {
-                                "code": "internal_error",
-                                "message": str(e)[:500],
-                                "tool": name,
-                                "args_were_string": was_string,
-                            },
-                        },
-                        f"{name}: error",
-                    ),
+                raw_body = await _read_body(receive)
+            except ValueError:
+                response: Response = rpc_err(None, "InvalidRequest", "body too large")
+                response.status_code = 413
+                await response(scope, receive, send)
+                return
+            response = await _dispatch_rpc(raw_body, scope)
+        elif method == "GET":
+            response = _manifest_response()
+        else:  # OPTIONS
+            response = Response(status_code=204, headers=_PREFLIGHT_HEADERS)
+        await response(scope, receive, send)
+
+
+app.router.routes.append(
+    Route("/mcp", _MCPEndpoint(), methods=["POST", "GET", "OPTIONS"])
+)
+
+
+# ---------------- MCP resources (HTTP) ----------------
+def _resource_connection_id(scope: Dict[str, Any]) -> Optional[str]:
+    for key, value in scope["headers"]:
+        if key == b"x-connection-id":
+            return value.decode("latin-1")
+    params = _scope_query_params(scope)
+    return params.get("cid") or params.get("connection_id")
+
+
+# файл схемы мал и уже в памяти — разделяемый Response быстрее sendfile-пути;
+# шарить объект можно только пока тело меньше minimum_size GZipMiddleware,
+# иначе middleware мутирует его raw_headers (см. _manifest_response)
+_SCHEMA_RESPONSE = Response(
+    _SCHEMA_BYTES, media_type="application/json", headers=_mcp_headers()
+)
+
+
+async def _resource_schema(connection_id: Optional[str]) -> Response:
+    return _SCHEMA_RESPONSE
+
+
+async def _resource_current(connection_id: Optional[str]) -> Response:
+    uid = _resolve_user_id(connection_id)
+    data = await gw("GET", "/api/db/user_summary", uid=uid)
+    payload = data if isinstance(data, dict) else {"data": data}
+    return ORJSONResponse(_okify(payload), headers=_mcp_headers())
+
+
+async def _resource_last_training(connection_id: Optional[str]) -> Response:
+    uid = _resolve_user_id(connection_id)
+    newest = date.today()
+    oldest = newest - timedelta(days=14)
+    data = await gw(
+        "GET",
+        "/trainings",
+        uid=uid,
+        params={"oldest": oldest.isoformat(), "newest": newest.isoformat()},
+    )
+    items = data if isinstance(data, list) else []
+    return ORJSONResponse(
+        {"ok": True, "last": _pick_last_training(items)},
+        headers=_mcp_headers(),
+    )
+
+
+_RESOURCE_HANDLERS: Mapping[str, Callable[[Optional[str]], Awaitable[Response]]] = (
+    MappingProxyType(
+        {
+            "schema.plan.json": _resource_schema,
+            "current.json": _resource_current,
+            "last_training.json": _resource_last_training,
+        }
+    )
+)
+_resource_handlers_get = _RESOURCE_HANDLERS.get
+
+
+class _ResourceEndpoint:
+    """GET /mcp/resource/<name>: dict-lookup вместо прохода FastAPI-роутинга."""
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        name = scope["path"].rsplit("/", 1)[-1]
+        handler = _resource_handlers_get(name)
+        if handler is None:
+            response: Response = ORJSONResponse(
+                {"detail": {"ok": False, "error": "resource_not_found", "name": name}},
+                status_code=404,
+                headers=_mcp_headers(),
+            )
+        else:
+            try:
+                response = await handler(_resource_connection_id(scope))
+            except HTTPException as exc:
+                response = ORJSONResponse(
+                    exc.detail, status_code=exc.status_code, headers=_mcp_headers()
                 )
+        await response(scope, receive, send)
+
 
-        return _rpc_ok(
-            id_,
-            _content({"ok": False, "error": {"code": "method_not_supported", "method": method}}, "unsupported"),
+app.router.routes.append(
+    Route("/mcp/resource/{name}", _ResourceEndpoint(), methods=["GET"])
+)
+
+
+# ---------------- MCP tools (HTTP) ----------------
+@app.post("/mcp/tool/plan.validate")
+async def plan_validate(request: Request):
+    body = orjson.loads(await request.body())
+    draft = body.get("draft") if isinstance(body, dict) else None
+    if draft is None:
+        draft = body if isinstance(body, dict) else {}
+    errors = _plan_errors(draft)
+    connection_id = body.get("connection_id") if isinstance(body, dict) else None
+    _append_audit(
+        {
+            "at": _utc_now_iso(),
+            "connection_id": connection_id,
+            "op": "plan.validate",
+            "external_id": (draft or {}).get("external_id"),
+            "status": "ok" if not errors else "invalid",
+        }
+    )
+    return ORJSONResponse(
+        {"ok": not errors, "errors": errors, "warnings": [], "diff": {}},
+        headers=_mcp_headers(),
+    )
+
+
+# успешные dry-run'ы помним недолго: подтверждение того же плана сразу после
+# предпросмотра обходится одним боевым POST вместо двух
+_DRY_RUN_TTL = 60.0
+_DRY_RUN_MAX = 128
+_DRY_RUN_CACHE: Dict[Tuple[str, str, bytes], float] = {}
+
+
+@app.post("/mcp/tool/plan.publish")
+async def plan_publish(request: Request):
+    body = orjson.loads(await request.body())
+    if not isinstance(body, dict):
+        raise HTTPException(status_code=400, detail="body must be an object")
+    connection_id = body.get("connection_id") or request.headers.get("x-connection-id")
+    uid = _resolve_user_id(connection_id)
+    if body.get("confirm") is not True:
+        return ORJSONResponse(
+            {"ok": False, "need_confirm": True, "hint": "Add confirm:true"},
+            headers=_mcp_headers(),
+        )
+
+    draft = body.get("draft") if isinstance(body.get("draft"), dict) else {}
+    days = draft.get("days") if isinstance(draft.get("days"), list) else None
+    external_id, external_id_normalized = normalize_plan_external_id(
+        str(body.get("external_id") or ""), days=days
+    )
+    events = _build_events(external_id_normalized, days)
+    payload = {"external_id": external_id_normalized, "events": events}
+
+    # dry-run, затем боевой POST (шлюз валидирует на первом проходе);
+    # повтор того же payload в окне TTL не гоняет валидацию второй раз
+    dry_key = (uid, external_id_normalized, orjson.dumps(events))
+    dry_ts = _DRY_RUN_CACHE.get(dry_key)
+    if dry_ts is None or monotonic() - dry_ts >= _DRY_RUN_TTL:
+        await gw(
+            "POST",
+            "/icu/events",
+            uid=uid,
+            params={"external_id_prefix": "plan:", "dry_run": "true"},
+            json_payload=payload,
+            ua=GW_USER_AGENT,
         )
-    except Exception as e:
-        return _rpc_ok(id_, _content({"ok": False, "error": {"code": "fatal", "message": str(e)[:500]}}, "fatal"))
+        if len(_DRY_RUN_CACHE) >= _DRY_RUN_MAX:
+            cutoff = monotonic() - _DRY_RUN_TTL
+            for stale in [k for k, ts in _DRY_RUN_CACHE.items() if ts < cutoff]:
+                del _DRY_RUN_CACHE[stale]
+            while len(_DRY_RUN_CACHE) >= _DRY_RUN_MAX:
+                # всё свежее — предел жёсткий, выселяем самую старую запись
+                del _DRY_RUN_CACHE[next(iter(_DRY_RUN_CACHE))]
+        # pop перед вставкой: порядок dict остаётся порядком старшинства
+        _DRY_RUN_CACHE.pop(dry_key, None)
+        _DRY_RUN_CACHE[dry_key] = monotonic()
+    resp = await gw(
+        "POST",
+        "/icu/events",
+        uid=uid,
+        params={"external_id_prefix": "plan:", "dry_run": "false"},
+        json_payload=payload,
+        ua=GW_USER_AGENT,
+    )
+
+    result: Json = {
+        "status": "published",
+        "external_id": external_id,
+        "external_id_normalized": external_id_normalized,
+        "days_written": _unique_days(events),
+    }
+    if isinstance(resp, dict) and "count" in resp:
+        result["count"] = resp["count"]
+    _append_audit(
+        {
+            "at": _utc_now_iso(),
+            "connection_id": connection_id,
+            "user_id": uid,
+            "op": "plan.publish",
+            "external_id": external_id_normalized,
+            "status": "published",
+            "days": _unique_days(events),
+        }
+    )
+    return ORJSONResponse(_okify(result), headers=_mcp_headers())
+
+
+@app.post("/mcp/tool/plan.delete")
+async def plan_delete(request: Request):
+    body = orjson.loads(await request.body())
+    if not isinstance(body, dict):
+        raise HTTPException(status_code=400, detail="body must be an object")
+    connection_id = body.get("connection_id") or request.headers.get("x-connection-id")
+    uid = _resolve_user_id(connection_id)
+    if body.get("confirm") is not True:
+        return ORJSONResponse(
+            {"ok": False, "need_confirm": True, "hint": "Add confirm:true"},
+            headers=_mcp_headers(),
+        )
+
+    external_id, external_id_normalized = normalize_plan_external_id(
+        str(body.get("external_id") or "")
+    )
+    oldest, newest = _window_for_external(external_id_normalized)
+    resp = await gw(
+        "DELETE",
+        "/icu/events",
+        uid=uid,
+        params={
+            "category": "WORKOUT",
+            "external_id": external_id_normalized,
+            "oldest": oldest,
+            "newest": newest,
+        },
+        ua=GW_USER_AGENT,
+    )
+    result: Json = {
+        "external_id": external_id,
+        "external_id_normalized": external_id_normalized,
+    }
+    if isinstance(resp, dict) and "count" in resp:
+        result["count"] = resp["count"]
+    _append_audit(
+        {
+            "at": _utc_now_iso(),
+            "connection_id": connection_id,
+            "user_id": uid,
+            "op": "plan.delete",
+            "external_id": external_id_normalized,
+            "status": "deleted",
+        }
+    )
+    return ORJSONResponse(_okify(result), headers=_mcp_headers())
+
+
+if __name__ == "__main__":  # локальный запуск: те же флаги, что и в render.yaml
+    import uvicorn
+
+    uvicorn.run(
+        "src.server:app",
+        host="0.0.0.0",
+        port=int(os.getenv("PORT", "8787")),
+        loop="uvloop" if uvloop is not None else "auto",
+        http="httptools",
+    )
@@ -1,3 +0,0 @@
-from .main import run
-
-__all__ = ["run"]
@@ -53,3 +53,23 @@ async def test_http_manifest_includes_read_tools() -> None:
     assert "plan.update" in names
     assert "plan.status" in names
     assert "plan.list" in names
+
+
+@pytest.mark.anyio
+async def test_http_manifest_alternates_gzip_and_identity() -> None:
+    # регрессия: GZipMiddleware мутирует raw_headers ответа in-place, и общий
+    # Response навсегда запоминал gzip-заголовки после первого сжатого GET
+    async with LifespanManager(app):
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://test") as client:
+            for accept_encoding in ("gzip", "identity", "gzip", "identity"):
+                response = await client.get(
+                    "/mcp", headers={"Accept-Encoding": accept_encoding}
+                )
+                assert response.status_code == 200
+                if accept_encoding == "gzip":
+                    assert response.headers.get("content-encoding") == "gzip"
+                else:
+                    assert "content-encoding" not in response.headers
+                assert response.headers.get_list("vary") == ["Accept-Encoding"]
+                assert response.json()["name"] == "stas-mcp"
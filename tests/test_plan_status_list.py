@@ -1,7 +1,10 @@
 import pytest
+from asgi_lifespan import LifespanManager
+from httpx import ASGITransport, AsyncClient
 
 from src.clients import gw
 from src.mcp import tools_plan_write_ext
+from src.server import app
 
 
 @pytest.mark.anyio
@@ -105,3 +108,42 @@ async def test_plan_list_default_limit(monkeypatch: pytest.MonkeyPatch) -> None:
     )
 
     assert result == {"items": [], "next_cursor": None}
+
+
+@pytest.mark.anyio
+async def test_plan_list_dates_pass_input_validation(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    # регрессия: даты в манифесте были с двойным экранированием, и включённая
+    # валидация inputSchema отклоняла корректные YYYY-MM-DD значения
+    async def fake_plan_list(**kwargs):
+        assert kwargs["date_from"] == "2025-01-01"
+        assert kwargs["date_to"] == "2025-01-31"
+        return {"items": [], "next_cursor": None}
+
+    monkeypatch.setattr(gw, "plan_list", fake_plan_list)
+
+    async with LifespanManager(app):
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.post(
+                "/mcp",
+                json={
+                    "jsonrpc": "2.0",
+                    "id": "list-dated",
+                    "method": "tools/call",
+                    "params": {
+                        "name": "plan.list",
+                        "arguments": {
+                            "user_id": 404,
+                            "date_from": "2025-01-01",
+                            "date_to": "2025-01-31",
+                        },
+                    },
+                },
+            )
+
+    assert response.status_code == 200
+    data = response.json()
+    assert "error" not in data
+    assert data["result"]["items"] == []
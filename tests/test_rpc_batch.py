@@ -0,0 +1,59 @@
+import pytest
+from asgi_lifespan import LifespanManager
+from httpx import ASGITransport, AsyncClient
+
+from src.server import app
+
+
+@pytest.mark.anyio
+async def test_batch_multiple_requests_preserves_order() -> None:
+    payload = [
+        {"jsonrpc": "2.0", "id": "a", "method": "initialize", "params": {}},
+        {"jsonrpc": "2.0", "id": "b", "method": "tools/list", "params": {}},
+        {"jsonrpc": "2.0", "id": "c", "method": "no/such.method", "params": {}},
+    ]
+
+    async with LifespanManager(app):
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.post("/mcp", json=payload)
+
+    assert response.status_code == 200
+    data = response.json()
+    assert isinstance(data, list)
+    assert [item["id"] for item in data] == ["a", "b", "c"]
+    assert data[0]["result"]["protocolVersion"]
+    tools = data[1]["result"]["tools"]
+    assert any(tool["name"] == "user.summary.fetch" for tool in tools)
+    assert data[2]["error"]["code"] == "MethodNotFound"
+
+
+@pytest.mark.anyio
+async def test_batch_single_request_returns_array() -> None:
+    payload = [{"jsonrpc": "2.0", "id": 1, "method": "tools/list", "params": {}}]
+
+    async with LifespanManager(app):
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.post("/mcp", json=payload)
+
+    assert response.status_code == 200
+    data = response.json()
+    assert isinstance(data, list)
+    assert len(data) == 1
+    assert data[0]["id"] == 1
+    assert data[0]["result"]["tools"]
+
+
+@pytest.mark.anyio
+async def test_batch_empty_is_invalid_request() -> None:
+    async with LifespanManager(app):
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.post("/mcp", json=[])
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["id"] is None
+    assert data["error"]["code"] == "InvalidRequest"
+    assert "empty" in data["error"]["message"]